@@ -1,10 +1,19 @@
 from fastapi import Header, HTTPException, Depends
 from typing import Optional
+from cachetools import TTLCache
+import hashlib
 
 # In a real production app, this would verify the JWT signature against 
 # Auth0 or AWS Cognito public keys.
 # For this implementation, we simulate extraction.
 
+# Resolved user ids keyed by a truncated SHA-256 of the token (never the raw token).
+# Short TTL so revoked/expired tokens stop resolving quickly once real JWT lands.
+_TOKEN_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=10)
+
+def _token_cache_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()[:16]
+
 async def get_current_user_id(authorization: Optional[str] = Header(None)) -> str:
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization Header")
@@ -13,6 +22,11 @@ async def get_current_user_id(authorization: Optional[str] = Header(None)) -> st
         scheme, token = authorization.split()
         if scheme.lower() != 'bearer':
             raise HTTPException(status_code=401, detail="Invalid Authentication Scheme")
+
+        cache_key = _token_cache_key(token)
+        cached_user_id = _TOKEN_CACHE.get(cache_key)
+        if cached_user_id is not None:
+            return cached_user_id
         
         # MOCK IMPLEMENTATION:
         # We expect a token like "bearer user-uuid-1234"
@@ -21,10 +35,13 @@ async def get_current_user_id(authorization: Optional[str] = Header(None)) -> st
         # For the test harness to work, we will treat the token string itself as the user_id 
         # if it's not a real JWT.
         if token.startswith("user-uuid-"):
-            return token
-        
-        # If we had real JWT logic, it would go here.
-        return "default-user-id" 
+            user_id = token
+        else:
+            # If we had real JWT logic, it would go here.
+            user_id = "default-user-id"
+
+        _TOKEN_CACHE[cache_key] = user_id
+        return user_id
 
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid Token")
@@ -1,7 +1,7 @@
 
 import os
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import DeclarativeBase
 
 # Logic: If DATABASE_URL is set, use it.
 # If not, check if we are local (likely docker-compose).
@@ -14,9 +14,32 @@ if not database_url:
     database_url = "sqlite+aiosqlite:////tmp/healx_fallback.db"
     print(f"WARNING: DATABASE_URL not set. Using SQLite fallback: {database_url}")
 else:
+    if database_url.startswith("postgresql://"):
+        # Force the asyncpg driver; a bare postgresql:// URL would resolve to psycopg2.
+        database_url = database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
     print(f"Connecting to database: {database_url}")
 
-engine = create_async_engine(database_url, echo=False)
+# Pool sizing only applies to Postgres; the aiosqlite fallback uses a NullPool.
+# Every uvicorn worker has its own pool, so DB_CONNECTION_BUDGET (total connections
+# across workers, kept under Postgres' default max_connections of 100) is split
+# between them: 20 + 10 overflow for a single worker, down to a single connection
+# per worker once there are as many workers as the budget allows.
+DB_CONNECTION_BUDGET = int(os.getenv("DB_CONNECTION_BUDGET", 80))
+WORKERS = int(os.getenv("WEB_CONCURRENCY", 1))
+_per_worker = min(30, max(1, DB_CONNECTION_BUDGET // WORKERS))
+POOL_SIZE = max(1, _per_worker * 2 // 3)
+MAX_OVERFLOW = _per_worker - POOL_SIZE
+engine_kwargs = {}
+if database_url.startswith("postgresql"):
+    engine_kwargs = dict(
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=False,
+        pool_recycle=1800,
+    )
+
+# A larger compiled cache keeps the hot ingest INSERT from being evicted by other queries.
+engine = create_async_engine(database_url, echo=False, query_cache_size=1200, **engine_kwargs)
 
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
@@ -25,7 +48,8 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
 )
 
-Base = declarative_base()
+class Base(DeclarativeBase):
+    pass
 
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -1,4 +1,5 @@
 
+import asyncio
 import logging
 import sys
 import os
@@ -12,34 +13,99 @@ logging.basicConfig(
 logger = logging.getLogger("app.main")
 logger.info("Initializing HealX Backend...")
 
-from fastapi import FastAPI, Depends, BackgroundTasks, HTTPException
+from fastapi import FastAPI, Depends, BackgroundTasks, HTTPException, Request, Body
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from pydantic import ValidationError
 from typing import List
+import orjson
 import uvicorn
 
-from app.database import get_db, engine, Base
+from app.database import (
+    get_db, engine, Base, POOL_SIZE, MAX_OVERFLOW, WORKERS, DB_CONNECTION_BUDGET, AsyncSessionLocal
+)
 from app.auth.dependencies import get_current_user_id
-from app.services.ingestion import IngestionService
-from app.services.media import MediaService
+from app.services.ingestion import (
+    IngestionService, observation_batcher, COPY_THRESHOLD
+)
+from app.services.media import MediaService, BUCKET_NAME
 from app.schemas import (
-    BatchIngestRequest, JournalEntryCreate, MediaUploadRequest, ObservationResponse
+    BatchIngestRequest, JournalEntryCreate, MediaUploadRequest, ObservationResponse,
+    OBS_LIST_ADAPTER
 )
 from app.models import User, JournalEntry, MediaFile
 
-app = FastAPI(title="HealX Health Data Vault")
+class ORJSONRequest(Request):
+    # FastAPI decodes JSON bodies via request.json() (stdlib json) before Pydantic sees them.
+    async def json(self):
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+class ORJSONRoute(APIRoute):
+    def get_route_handler(self):
+        original_handler = super().get_route_handler()
+
+        async def handler(request: Request):
+            return await original_handler(ORJSONRequest(request.scope, request.receive))
+
+        return handler
 
-# Enable CORS
+app = FastAPI(title="HealX Health Data Vault", default_response_class=ORJSONResponse)
+# Must be set before any routes are declared
+app.router.route_class = ORJSONRoute
+
+# Enable CORS for an explicit origin list (comma-separated ALLOWED_ORIGINS).
+# Auth is a bearer header, not cookies, so credentials are not needed.
+_DEFAULT_ORIGINS = "http://localhost:3000,http://localhost:8080"
+allowed_origins = [
+    origin.strip()
+    for origin in os.getenv("ALLOWED_ORIGINS", _DEFAULT_ORIGINS).split(",")
+    if origin.strip()
+]
+if "ALLOWED_ORIGINS" not in os.environ:
+    logger.warning(
+        f"ALLOWED_ORIGINS not set; CORS only allows local development origins ({_DEFAULT_ORIGINS}). "
+        "Browser clients on any other origin will be rejected."
+    )
+else:
+    logger.info(f"CORS allowed origins: {allowed_origins}")
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"], 
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=allowed_origins,
+    allow_credentials=False,
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type"],
 )
 
+async def _warm_pool(size: int):
+    # Open `size` connections concurrently and return them to the pool, so the
+    # first burst of requests doesn't serialize on connection setup.
+    async def _touch():
+        async with engine.connect():
+            pass
+    await asyncio.gather(*(_touch() for _ in range(size)))
+    logger.info(f"Pre-warmed {size} database connections.")
+
+# create_all doesn't add indexes to existing tables, and the source upsert's
+# ON CONFLICT (name) needs this one. Older databases may hold duplicate names
+# from the pre-upsert race: repoint their observations to the lowest id first.
+_DEDUPE_SOURCES_SQL = [
+    # Serialize workers running this at the same startup
+    "SELECT pg_advisory_xact_lock(hashtext('ix_data_sources_name'))",
+    """
+    UPDATE health_observations o SET source_id = d.keep_id
+    FROM (SELECT id, MIN(id) OVER (PARTITION BY name) AS keep_id FROM data_sources) d
+    WHERE o.source_id = d.id AND d.id <> d.keep_id
+    """,
+    "DELETE FROM data_sources s USING data_sources k WHERE s.name = k.name AND s.id > k.id",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_data_sources_name ON data_sources (name)",
+]
+
 @app.on_event("startup")
 async def startup():
     logger.info("Application startup event triggered.")
@@ -48,9 +114,22 @@ async def startup():
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
         logger.info("Database tables verified/created successfully.")
+        if engine.dialect.name == "postgresql":
+            async with engine.begin() as conn:
+                for statement in _DEDUPE_SOURCES_SQL:
+                    await conn.exec_driver_sql(statement)
+            logger.info(
+                f"Database pool: {POOL_SIZE} + {MAX_OVERFLOW} overflow connections per worker "
+                f"({WORKERS} workers, budget {DB_CONNECTION_BUDGET})."
+            )
+            await _warm_pool(POOL_SIZE)
     except Exception as e:
         logger.error(f"CRITICAL DATABASE ERROR: Could not connect to DB. App running in limited mode. Error: {e}")
 
+# Static payloads serialized once at import and reused on every call
+_HEALTH_RESPONSE = ORJSONResponse(content={"status": "healthy", "service": "HealX Backend"})
+_INDEX_MISSING_RESPONSE = ORJSONResponse(content={"message": "HealX Backend Running. index.html not found."})
+
 # --- FRONTEND SERVING ---
 # Serve the React app directly from the FastAPI backend for simple deployment
 
@@ -58,7 +137,7 @@ async def startup():
 async def serve_index():
     if os.path.exists("index.html"):
         return FileResponse("index.html")
-    return {"message": "HealX Backend Running. index.html not found."}
+    return _INDEX_MISSING_RESPONSE
 
 @app.get("/index.tsx")
 async def serve_tsx():
@@ -66,16 +145,42 @@ async def serve_tsx():
         return FileResponse("index.tsx", media_type="text/plain")
     return {"error": "File not found"}
 
-@app.get("/health")
-def health_check():
-    return {"status": "healthy", "service": "HealX Backend"}
+@app.get("/health", response_class=ORJSONResponse)
+async def health_check():
+    return _HEALTH_RESPONSE
 
 # --- OBSERVATIONS ---
 
-@app.post("/observations/batch", status_code=201)
+def _inline_schema(model) -> dict:
+    # Operation-level schemas can't use pydantic's local "#/$defs/..." refs, so inline them
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(defs[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        return node
+
+    return resolve(schema)
+
+# The body is taken as a plain dict (validated below), so publish the real shape for OpenAPI
+_BATCH_OPENAPI = {
+    "requestBody": {"content": {"application/json": {"schema": _inline_schema(BatchIngestRequest)}}}
+}
+
+def _missing_field(loc: tuple, payload: dict) -> RequestValidationError:
+    return RequestValidationError([{
+        "type": "missing", "loc": loc, "msg": "Field required", "input": payload,
+    }])
+
+@app.post("/observations/batch", status_code=201, openapi_extra=_BATCH_OPENAPI)
 async def ingest_batch(
-    payload: BatchIngestRequest,
     background_tasks: BackgroundTasks,
+    payload: dict = Body(...),
     db: AsyncSession = Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
@@ -83,8 +188,57 @@ async def ingest_batch(
     if user_id.startswith("user-uuid-"):
         pass 
 
+    # Validate the rows with one TypeAdapter pass instead of FastAPI's per-model body parsing
+    if "source_name" not in payload:
+        raise _missing_field(("body", "source_name"), payload)
+    if "data" not in payload:
+        raise _missing_field(("body", "data"), payload)
+    source_name = payload["source_name"]
+    if not isinstance(source_name, str):
+        raise RequestValidationError([{
+            "type": "string_type", "loc": ("body", "source_name"),
+            "msg": "Input should be a valid string", "input": source_name,
+        }])
+    try:
+        items = OBS_LIST_ADAPTER.validate_python(payload["data"])
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**err, "loc": ("body", "data", *err["loc"])} for err in e.errors()]
+        )
+    batch = BatchIngestRequest.model_construct(source_name=source_name, data=items)
+
     service = IngestionService(db)
-    result = await service.process_batch(user_id, payload)
+    # Large payloads fill a flush on their own: write them in this request's own
+    # transaction (COPY on Postgres) so the client learns whether they were stored.
+    if len(batch.data) >= COPY_THRESHOLD:
+        result = await service.process_batch(user_id, batch)
+        return {"status": "success", "details": result}
+
+    rows, unknown_metrics, source_id = await service.prepare_batch(user_id, batch)
+    # Persist a newly created data source before another session references it
+    await db.commit()
+
+    # Hot path: coalesce with concurrent requests into a single INSERT/commit
+    processed = await observation_batcher.process(rows) if rows else 0
+    result = {
+        "processed": processed,
+        "skipped_unknown_metrics": unknown_metrics,
+        "source_id": source_id
+    }
+    
+    return {"status": "success", "details": result}
+
+@app.post("/observations/batch/stream", status_code=201)
+async def ingest_batch_stream(
+    request: Request,
+    source_name: str,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    # Same body shape as /observations/batch (source_name moves to the query string);
+    # parsed incrementally so ingest starts before the upload finishes.
+    service = IngestionService(db)
+    result = await service.process_stream(user_id, source_name, request.stream())
     
     return {"status": "success", "details": result}
 
@@ -109,29 +263,61 @@ async def save_journal_entry(
 
 # --- MEDIA ---
 
+async def _persist_media_file(user_id: str, req: MediaUploadRequest, file_path: str):
+    # Runs after the response is sent, so it owns its own session
+    async with AsyncSessionLocal() as db:
+        media_file = MediaFile(
+            user_id=user_id,
+            category=req.file_type,
+            s3_bucket=BUCKET_NAME,
+            s3_key=file_path,
+            filename=req.filename,
+            mime_type=req.content_type
+        )
+        db.add(media_file)
+        try:
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to record media file {file_path}: {e}")
+
 @app.post("/media/upload-url")
 async def get_presigned_url(
     req: MediaUploadRequest,
-    user_id: str = Depends(get_current_user_id),
-    db: AsyncSession = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    user_id: str = Depends(get_current_user_id)
 ):
-    result = MediaService.generate_signed_url(user_id, req.filename, req.content_type)
-    
-    media_file = MediaFile(
-        user_id=user_id,
-        category=req.file_type,
-        s3_bucket=os.getenv('FIREBASE_STORAGE_BUCKET', 'unknown'),
-        s3_key=result['file_path'],
-        filename=req.filename,
-        mime_type=req.content_type
+    # URL signing is sync/CPU-bound (RSA); keep it off the event loop
+    result = await asyncio.to_thread(
+        MediaService.generate_signed_url, user_id, req.filename, req.content_type
     )
-    db.add(media_file)
-    await db.commit()
+    
+    # Record the upload after responding; the signed URL is the critical path
+    background_tasks.add_task(_persist_media_file, user_id, req, result['file_path'])
     
     return result
 
 if __name__ == "__main__":
     # Cloud Run provides PORT via env var
     port = int(os.getenv("PORT", 8080))
-    logger.info(f"Starting Uvicorn on port {port}...")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvloop/httptools come from `pip install 'uvicorn[standard]'` (see requirements.txt)
+    # Default to 2*cores+1, but never more workers than the DB connection budget can give
+    # one connection each; an explicit WEB_CONCURRENCY above that can exceed the budget.
+    workers = int(os.getenv("WEB_CONCURRENCY", min((os.cpu_count() or 2) * 2 + 1, DB_CONNECTION_BUDGET)))
+    if workers > DB_CONNECTION_BUDGET:
+        logger.warning(
+            f"WEB_CONCURRENCY={workers} exceeds DB_CONNECTION_BUDGET={DB_CONNECTION_BUDGET}; "
+            "each worker still opens at least one database connection."
+        )
+    # Worker processes inherit this and size their DB pools to share the connection budget
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    logger.info(f"Starting Uvicorn on port {port} with {workers} workers...")
+    # Multiple workers require the app as an import string rather than an object
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        log_level="info",
+    )
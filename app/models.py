@@ -1,11 +1,14 @@
 import uuid
-from datetime import datetime
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Any, Optional
 from sqlalchemy import (
-    Column, Integer, String, Float, Boolean, ForeignKey, 
-    DateTime, Date, Text, JSON, Numeric, Enum, ARRAY, CheckConstraint
+    Integer, String, Float, Double, Boolean, ForeignKey, 
+    DateTime, Date, Text, JSON, Numeric, Enum, ARRAY, CheckConstraint, type_coerce
 )
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 import enum
 
 from app.database import Base
@@ -37,49 +40,67 @@ class MedType(str, enum.Enum):
     Nootropic = 'Nootropic'
     Peptide = 'Peptide'
 
+# Column types
+
+class FloatNumeric(TypeDecorator):
+    """
+    NUMERIC storage with float in/out. Parameters are bound as DOUBLE PRECISION so
+    Postgres does the numeric conversion, instead of building a Decimal per row.
+    That cast keeps 15 significant digits (DBL_DIG) before rounding to the column's
+    scale; the COPY path in ingestion rounds the same way.
+    """
+    impl = Numeric
+    cache_ok = True
+
+    def __init__(self, precision: int, scale: int):
+        super().__init__(precision, scale, asdecimal=False)
+
+    def bind_expression(self, bindvalue):
+        return type_coerce(bindvalue, Double())
+
 # Tables
 
 class User(Base):
     __tablename__ = "users"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    email = Column(String(255), unique=True, nullable=False)
-    auth0_sub = Column(String(255), unique=True)
-    role = Column(Enum(UserRole), default=UserRole.patient)
-    first_name = Column(String(100))
-    last_name = Column(String(100))
-    dob = Column(Date)
-    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
-    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    email: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
+    auth0_sub: Mapped[Optional[str]] = mapped_column(String(255), unique=True)
+    role: Mapped[Optional[UserRole]] = mapped_column(Enum(UserRole), default=UserRole.patient)
+    first_name: Mapped[Optional[str]] = mapped_column(String(100))
+    last_name: Mapped[Optional[str]] = mapped_column(String(100))
+    dob: Mapped[Optional[date]] = mapped_column(Date)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class DataSource(Base):
     __tablename__ = "data_sources"
-    id = Column(Integer, primary_key=True)
-    name = Column(String(100), nullable=False)
-    api_key_hash = Column(String(255))
-    is_trusted = Column(Boolean, default=False)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(100), unique=True, nullable=False, index=True)
+    api_key_hash: Mapped[Optional[str]] = mapped_column(String(255))
+    is_trusted: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
 
 class MetricDefinition(Base):
     __tablename__ = "metric_definitions"
-    id = Column(Integer, primary_key=True)
-    code = Column(String(50), unique=True, nullable=False, index=True)
-    display_name = Column(String(100), nullable=False)
-    category = Column(Enum(MetricCategory), nullable=False)
-    unit = Column(String(20))
-    description = Column(Text)
-    ref_min = Column(Numeric(10, 4))
-    ref_max = Column(Numeric(10, 4))
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    code: Mapped[str] = mapped_column(String(50), unique=True, nullable=False, index=True)
+    display_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    category: Mapped[MetricCategory] = mapped_column(Enum(MetricCategory), nullable=False)
+    unit: Mapped[Optional[str]] = mapped_column(String(20))
+    description: Mapped[Optional[str]] = mapped_column(Text)
+    ref_min: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 4))
+    ref_max: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 4))
 
 class HealthObservation(Base):
     __tablename__ = "health_observations"
-    id = Column(Integer, primary_key=True, autoincrement=True) # BigSerial logic handled by DB
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    metric_id = Column(Integer, ForeignKey("metric_definitions.id"), nullable=False)
-    source_id = Column(Integer, ForeignKey("data_sources.id"))
-    recorded_at = Column(DateTime(timezone=True), nullable=False)
-    ingested_at = Column(DateTime(timezone=True), default=datetime.utcnow)
-    value_numeric = Column(Numeric(18, 6), nullable=True)
-    value_text = Column(Text, nullable=True)
-    raw_metadata = Column(JSON, nullable=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True) # BigSerial logic handled by DB
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    metric_id: Mapped[int] = mapped_column(Integer, ForeignKey("metric_definitions.id"), nullable=False)
+    source_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("data_sources.id"))
+    recorded_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    ingested_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    value_numeric: Mapped[Optional[float]] = mapped_column(FloatNumeric(18, 6), nullable=True)
+    value_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    raw_metadata: Mapped[Optional[dict[str, Any]]] = mapped_column(JSON, nullable=True)
 
     __table_args__ = (
         CheckConstraint('value_numeric IS NOT NULL OR value_text IS NOT NULL', name='check_has_value'),
@@ -87,25 +108,25 @@ class HealthObservation(Base):
 
 class Medication(Base):
     __tablename__ = "medications"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    name = Column(String(200), nullable=False)
-    type = Column(Enum(MedType), default=MedType.Supplement)
-    dosage = Column(String(100))
-    frequency = Column(String(100))
-    is_active = Column(Boolean, default=True)
-    start_date = Column(Date)
-    end_date = Column(Date)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    name: Mapped[str] = mapped_column(String(200), nullable=False)
+    type: Mapped[Optional[MedType]] = mapped_column(Enum(MedType), default=MedType.Supplement)
+    dosage: Mapped[Optional[str]] = mapped_column(String(100))
+    frequency: Mapped[Optional[str]] = mapped_column(String(100))
+    is_active: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    start_date: Mapped[Optional[date]] = mapped_column(Date)
+    end_date: Mapped[Optional[date]] = mapped_column(Date)
 
 class JournalEntry(Base):
     __tablename__ = "journal_entries"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    entry_date = Column(Date, nullable=False)
-    content_markdown = Column(Text)
-    mood_score = Column(Integer)
-    tags = Column(ARRAY(Text))
-    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    entry_date: Mapped[date] = mapped_column(Date, nullable=False)
+    content_markdown: Mapped[Optional[str]] = mapped_column(Text)
+    mood_score: Mapped[Optional[int]] = mapped_column(Integer)
+    tags: Mapped[Optional[list[str]]] = mapped_column(ARRAY(Text))
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
     
     __table_args__ = (
         CheckConstraint('mood_score BETWEEN 1 AND 10', name='check_mood_score'),
@@ -113,13 +134,13 @@ class JournalEntry(Base):
 
 class MediaFile(Base):
     __tablename__ = "media_files"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    category = Column(Enum(FileCategory), nullable=False)
-    s3_bucket = Column(String(100), nullable=False) # Maps to Firebase bucket name
-    s3_key = Column(String(500), nullable=False) # Maps to Firebase Storage Path
-    filename = Column(String(255))
-    mime_type = Column(String(100))
-    size_bytes = Column(Integer)
-    is_processed = Column(Boolean, default=False)
-    uploaded_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    category: Mapped[FileCategory] = mapped_column(Enum(FileCategory), nullable=False)
+    s3_bucket: Mapped[str] = mapped_column(String(100), nullable=False) # Maps to Firebase bucket name
+    s3_key: Mapped[str] = mapped_column(String(500), nullable=False) # Maps to Firebase Storage Path
+    filename: Mapped[Optional[str]] = mapped_column(String(255))
+    mime_type: Mapped[Optional[str]] = mapped_column(String(100))
+    size_bytes: Mapped[Optional[int]] = mapped_column(Integer)
+    is_processed: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    uploaded_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date
 from uuid import UUID
@@ -10,19 +10,15 @@ class ObservationInput(BaseModel):
     value_numeric: Optional[float] = None
     value_text: Optional[str] = None
     raw_metadata: Optional[Dict[str, Any]] = None
-
-    @field_validator('value_numeric', 'value_text')
-    @classmethod
-    def check_one_value(cls, v, values):
-        # Note: Pydantic v2 validation logic is slightly different, 
-        # but for simplicity we rely on database constraints or upper level logic
-        # This is a basic structural validation.
-        return v
+    # "At least one value" is enforced by the check_has_value DB constraint.
 
 class BatchIngestRequest(BaseModel):
     source_name: str
     data: List[ObservationInput]
 
+# Validates a whole batch of observations in a single pydantic-core pass
+OBS_LIST_ADAPTER = TypeAdapter(List[ObservationInput])
+
 class ObservationResponse(BaseModel):
     metric_code: str
     recorded_at: datetime
@@ -1,80 +1,207 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.models import HealthObservation, MetricDefinition, DataSource, User
-from app.schemas import BatchIngestRequest
+from app.schemas import BatchIngestRequest, OBS_LIST_ADAPTER
+from app.database import AsyncSessionLocal
 from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from cachetools import TTLCache
+from datetime import datetime, timezone
+from typing import AsyncIterator
+import asyncio
 import logging
+import time
+import ijson
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Built once so every batch hits the engine's compiled cache for the same statement.
+# Against the Table (not the ORM entity) so a batch is one Core executemany; the ORM
+# bulk path drops None keys and splits rows into one execute per null pattern.
+_OBS_INSERT = insert(HealthObservation.__table__)
+
+# Batches at or above this size are streamed through COPY on Postgres
+COPY_THRESHOLD = 1000
+_COPY_COLUMNS = [
+    "user_id", "metric_id", "source_id", "recorded_at", "ingested_at",
+    "value_numeric", "value_text", "raw_metadata",
+]
+
+# Streamed payloads are validated and inserted this many rows at a time
+STREAM_CHUNK_SIZE = 1000
+# A streamed upload holds a pool connection until it commits, so bound how long
+# a client may stall between body chunks and how long the whole upload may take.
+STREAM_READ_TIMEOUT_SECONDS = 10
+STREAM_MAX_SECONDS = 300
+
+# Process-wide metric cache: {"HEALX_TEST_TOTAL": 101, ...}
+METRIC_MAP_TTL_SECONDS = 300
+_METRIC_MAP: dict[str, int] = {}
+_METRIC_MAP_EXPIRES = 0.0
+_METRIC_MAP_LOCK = asyncio.Lock()
+
+# Process-wide source cache: {"Apple Health": 1, ...}; sources are few and rarely change
+_SOURCE_IDS: TTLCache = TTLCache(maxsize=1024, ttl=600)
+# Serializes cold-cache lookups within the process; the ON CONFLICT upsert settles
+# races across processes, so one lock (not one per client-supplied name) is enough.
+_SOURCE_LOCK = asyncio.Lock()
+
+# Dialects whose insert() supports ON CONFLICT ... RETURNING
+_UPSERT_BY_DIALECT = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
 class IngestionService:
     def __init__(self, db: AsyncSession):
         self.db = db
-        self.metric_map = {} # Cache: {"HEALX_TEST_TOTAL": 101, ...}
 
-    async def _load_metric_map(self):
+    async def _load_metric_map(self) -> dict[str, int]:
         """
-        Fetches all metric definitions into a dictionary for O(1) lookup.
-        In production, cache this in Redis or memory with a TTL.
+        Returns all metric definitions as a dictionary for O(1) lookup.
+        The map is shared across requests and refreshed at most once per TTL.
         """
-        result = await self.db.execute(select(MetricDefinition.id, MetricDefinition.code))
-        rows = result.all()
-        # Create map: code -> id
-        self.metric_map = {row.code: row.id for row in rows}
-        logger.info(f"Loaded {len(self.metric_map)} metrics into cache.")
+        global _METRIC_MAP, _METRIC_MAP_EXPIRES
+        if time.monotonic() < _METRIC_MAP_EXPIRES:
+            return _METRIC_MAP
+
+        async with _METRIC_MAP_LOCK:
+            # Another request may have refreshed while we waited on the lock
+            if time.monotonic() < _METRIC_MAP_EXPIRES:
+                return _METRIC_MAP
+
+            result = await self.db.execute(select(MetricDefinition.id, MetricDefinition.code))
+            rows = result.all()
+            # Create map: code -> id
+            _METRIC_MAP = {row.code: row.id for row in rows}
+            _METRIC_MAP_EXPIRES = time.monotonic() + METRIC_MAP_TTL_SECONDS
+            logger.info(f"Loaded {len(_METRIC_MAP)} metrics into cache.")
+        return _METRIC_MAP
 
     async def _get_or_create_source(self, source_name: str) -> int:
-        # Simple lookup for source ID. 
-        # In high throughput, sources are few, so we can query or cache.
-        result = await self.db.execute(select(DataSource).where(DataSource.name == source_name))
-        source = result.scalars().first()
-        if source:
-            return source.id
-        
-        # Create if not exists (simplistic approach, watch for race conditions in distributed env)
-        new_source = DataSource(name=source_name, is_trusted=False)
-        self.db.add(new_source)
-        await self.db.flush() # Get ID without committing transaction
-        return new_source.id
+        # Sources are few, so repeated batches from the same source skip the query.
+        source_id = _SOURCE_IDS.get(source_name)
+        if source_id is not None:
+            return source_id
 
-    async def process_batch(self, user_id: str, batch: BatchIngestRequest):
+        async with _SOURCE_LOCK:
+            # Another request may have resolved it while we waited on the lock
+            source_id = _SOURCE_IDS.get(source_name)
+            if source_id is not None:
+                return source_id
+
+            result = await self.db.execute(select(DataSource.id).where(DataSource.name == source_name))
+            source_id = result.scalar()
+            if source_id is not None:
+                _SOURCE_IDS[source_name] = source_id
+                return source_id
+
+            # Create if not exists. The upsert lets the unique index settle races across
+            # workers/instances: a concurrent creator blocks, then gets the existing id.
+            # Not cached yet: the row is uncommitted and may still be rolled back.
+            upsert = _UPSERT_BY_DIALECT.get(self.db.bind.dialect.name)
+            if upsert is None:
+                new_source = DataSource(name=source_name, is_trusted=False)
+                self.db.add(new_source)
+                await self.db.flush() # Get ID without committing transaction
+                return new_source.id
+
+            stmt = upsert(DataSource).values(name=source_name, is_trusted=False)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[DataSource.name], set_={"name": stmt.excluded.name}
+            ).returning(DataSource.id)
+            result = await self.db.execute(stmt)
+            return result.scalar_one()
+
+    async def _copy_observations(self, rows: list[dict]):
+        """
+        Streams rows via asyncpg's binary COPY, bypassing the SQL parser.
+        COPY skips SQLAlchemy column defaults, so rows must carry ingested_at.
+        """
+        conn = await self.db.connection()
+        raw = await conn.get_raw_connection()
+        if not raw.driver_connection.is_in_transaction():
+            # The asyncpg adapter only opens its transaction when a statement runs through
+            # it; without one, COPY would autocommit and escape the caller's rollback.
+            await conn.exec_driver_sql("SELECT 1")
+        records = (
+            (
+                row["user_id"], row["metric_id"], row["source_id"], row["recorded_at"],
+                row["ingested_at"],
+                # Rounded to 15 significant digits, like Postgres' float8 -> numeric cast
+                # that FloatNumeric relies on, so both insert paths store the same value
+                f"{row['value_numeric']:.15g}" if row["value_numeric"] is not None else None,
+                row["value_text"],
+                # asyncpg's json codec expects pre-encoded text. None is encoded as JSON
+                # 'null' to match what the JSON type binds on the executemany path.
+                orjson.dumps(row["raw_metadata"]).decode(),
+            )
+            for row in rows
+        )
+        await raw.driver_connection.copy_records_to_table(
+            HealthObservation.__tablename__, records=records, columns=_COPY_COLUMNS
+        )
+
+    async def _insert_observations(self, rows: list[dict]):
+        # Caller is responsible for commit/rollback
+        if len(rows) >= COPY_THRESHOLD and self.db.bind.dialect.name == "postgresql":
+            await self._copy_observations(rows)
+        else:
+            await self.db.execute(_OBS_INSERT, rows)
+
+    async def prepare_batch(self, user_id: str, batch: BatchIngestRequest):
+        """
+        Resolves metric/source ids and builds insert-ready row dicts.
+        Returns (rows, unknown_metric_codes, source_id) without writing observations.
+        """
         # 0. Validate User (Optional if constraints require it)
         # Ensure user exists logic could go here, or let FK constraint fail.
         
         # 1. Ensure our map is loaded
-        if not self.metric_map:
-            await self._load_metric_map()
+        metric_map = await self._load_metric_map()
         
         source_id = await self._get_or_create_source(batch.source_name)
-        
+        observations_to_insert, unknown_metrics = self._build_rows(user_id, source_id, batch.data, metric_map)
+        return observations_to_insert, list(unknown_metrics), source_id
+
+    def _build_rows(self, user_id: str, source_id: int, items: list, metric_map: dict[str, int]):
+        """Returns (rows, unknown_metric_codes) for already-resolved metric/source ids."""
         observations_to_insert = []
-        unknown_metrics = []
+        unknown_metrics: set[str] = set()
+        # One timestamp per batch instead of a per-row column default callback
+        now = datetime.now(timezone.utc)
 
         # 2. Iterate line-by-line (in memory)
-        for item in batch.data:
-            metric_id = self.metric_map.get(item.metric_code)
+        for item in items:
+            metric_id = metric_map.get(item.metric_code)
             
             if not metric_id:
                 # Handle unknown metrics (Log them, or skip)
-                unknown_metrics.append(item.metric_code)
+                unknown_metrics.add(item.metric_code)
                 continue
 
-            # 3. Build the DB Object
-            obs = HealthObservation(
-                user_id=user_id,
-                metric_id=metric_id,
-                source_id=source_id,
-                recorded_at=item.recorded_at,
-                value_numeric=item.value_numeric,
-                value_text=item.value_text,
-                raw_metadata=item.raw_metadata
-            )
-            observations_to_insert.append(obs)
+            # 3. Build a plain parameter dict (no ORM instance / identity-map overhead)
+            observations_to_insert.append({
+                "user_id": user_id,
+                "metric_id": metric_id,
+                "source_id": source_id,
+                "recorded_at": item.recorded_at,
+                "ingested_at": now,
+                "value_numeric": item.value_numeric,
+                "value_text": item.value_text,
+                "raw_metadata": item.raw_metadata,
+            })
+
+        return observations_to_insert, unknown_metrics
 
-        # 4. Bulk Insert (Single Transaction)
+    async def process_batch(self, user_id: str, batch: BatchIngestRequest):
+        observations_to_insert, unknown_metrics, source_id = await self.prepare_batch(user_id, batch)
+
+        # 4. Bulk Insert (Single Transaction; COPY for large Postgres batches, else executemany)
         if observations_to_insert:
-            self.db.add_all(observations_to_insert)
             try:
+                await self._insert_observations(observations_to_insert)
                 await self.db.commit() # Commits all 50 or 5,000 rows at once
             except Exception as e:
                 await self.db.rollback()
@@ -83,6 +210,227 @@ class IngestionService:
 
         return {
             "processed": len(observations_to_insert),
-            "skipped_unknown_metrics": list(set(unknown_metrics)), # Deduplicate
+            "skipped_unknown_metrics": unknown_metrics,
             "source_id": source_id
         }
+
+    async def _ingest_stream_chunk(self, user_id: str, source_name: str, source_id: int | None,
+                                   raw_items: list, offset: int):
+        """Validates and inserts one chunk; returns (source_id, inserted, unknown_metric_codes)."""
+        try:
+            items = OBS_LIST_ADAPTER.validate_python(raw_items)
+        except ValidationError as e:
+            # Report locations relative to the whole payload, not the chunk
+            raise RequestValidationError([
+                {**err, "loc": ("body", "data", offset + err["loc"][0], *err["loc"][1:])}
+                for err in e.errors()
+            ])
+        if source_id is None:
+            source_id = await self._resolve_stream_source(source_name)
+        rows, unknown_metrics = self._build_rows(user_id, source_id, items, await self._load_metric_map())
+        if rows:
+            await self._insert_observations(rows)
+        return source_id, len(rows), unknown_metrics
+
+    async def _resolve_stream_source(self, source_name: str) -> int:
+        # Committed before any observation is written (as /observations/batch does), so
+        # the id is only cached once the row is durable and every chunk reuses it.
+        source_id = await self._get_or_create_source(source_name)
+        await self.db.commit()
+        _SOURCE_IDS[source_name] = source_id
+        return source_id
+
+    async def process_stream(self, user_id: str, source_name: str, chunks: AsyncIterator[bytes]):
+        """
+        Ingests a {"data": [...]} body straight from an async byte stream.
+        Rows are parsed incrementally and inserted STREAM_CHUNK_SIZE at a time,
+        all within one transaction, so the full payload is never held in memory.
+        """
+        source_id = None
+        processed = 0
+        unknown_metrics: set[str] = set()
+        pending: list = []
+        offset = 0
+        reader = _StreamReader(chunks, STREAM_READ_TIMEOUT_SECONDS, STREAM_MAX_SECONDS)
+        try:
+            async for raw_item in _iter_data_items(reader):
+                pending.append(raw_item)
+                if len(pending) >= STREAM_CHUNK_SIZE:
+                    source_id, count, unknown = await self._ingest_stream_chunk(
+                        user_id, source_name, source_id, pending, offset
+                    )
+                    processed += count
+                    unknown_metrics.update(unknown)
+                    offset += len(pending)
+                    pending = []
+            # Also runs for an empty "data" array, which still registers the source
+            if pending or source_id is None:
+                source_id, count, unknown = await self._ingest_stream_chunk(
+                    user_id, source_name, source_id, pending, offset
+                )
+                processed += count
+                unknown_metrics.update(unknown)
+            await self.db.commit()
+        except RequestValidationError:
+            await self.db.rollback()
+            raise
+        except ijson.JSONError as e:
+            await self.db.rollback()
+            logger.warning(f"Rejected malformed streamed batch: {e}")
+            raise HTTPException(status_code=400, detail="Malformed JSON body")
+        except asyncio.TimeoutError:
+            await self.db.rollback()
+            logger.warning(f"Streamed batch timed out after {processed} rows")
+            raise HTTPException(status_code=408, detail="Request body read timed out")
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Streamed batch insert failed: {e}")
+            raise HTTPException(status_code=500, detail="Batch insert failed")
+
+        return {
+            "processed": processed,
+            "skipped_unknown_metrics": list(unknown_metrics),
+            "source_id": source_id
+        }
+
+
+async def _iter_data_items(reader) -> AsyncIterator:
+    """
+    Yields the elements of the body's top-level "data" array as they are parsed.
+    Raises RequestValidationError once the body ends without such an array.
+    """
+    data_event = None
+    builder = None
+    async for prefix, event, value in ijson.parse(reader, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == "data.item" and event in ("end_map", "end_array"):
+                yield builder.value
+                builder = None
+        elif prefix == "data":
+            if data_event is None:
+                data_event = event
+        elif prefix == "data.item" and data_event == "start_array":
+            if event in ("start_map", "start_array"):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            else:
+                # Scalar element; left for the row validation to reject
+                yield value
+
+    if data_event is None:
+        raise RequestValidationError([{
+            "type": "missing", "loc": ("body", "data"), "msg": "Field required", "input": None,
+        }])
+    if data_event != "start_array":
+        raise RequestValidationError([{
+            "type": "list_type", "loc": ("body", "data"), "msg": "Input should be a valid list", "input": None,
+        }])
+
+
+class _StreamReader:
+    """
+    Adapts an async iterator of byte chunks (e.g. Request.stream()) to ijson's async read().
+    Raises asyncio.TimeoutError if a chunk takes longer than read_timeout to arrive or
+    the whole stream runs past max_duration seconds.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], read_timeout: float, max_duration: float):
+        self._chunks = chunks.__aiter__()
+        self._read_timeout = read_timeout
+        self._deadline = time.monotonic() + max_duration
+
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            # ijson probes with read(0) to detect bytes vs str; must not consume data
+            return b""
+        # An empty chunk means EOF to ijson, so skip any empty messages mid-stream
+        while True:
+            timeout = min(self._read_timeout, self._deadline - time.monotonic())
+            if timeout <= 0:
+                raise asyncio.TimeoutError
+            try:
+                chunk = await asyncio.wait_for(self._chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                return b""
+            if chunk:
+                return chunk
+
+
+class ObservationBatcher:
+    """
+    Coalesces prepared rows from concurrent ingest requests into one transaction.
+    A flush happens once max_batch_size rows are queued or max_queue_time seconds
+    after the first queued row, whichever comes first. If the combined insert fails,
+    each caller's rows are retried in their own savepoint, so only the callers whose
+    rows break a constraint get an error.
+    """
+
+    def __init__(self, max_batch_size: int = 5000, max_queue_time: float = 0.010,
+                 session_factory=AsyncSessionLocal):
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self.session_factory = session_factory
+        self._pending: list[tuple[list[dict], asyncio.Future]] = []
+        self._pending_rows = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def process(self, rows: list[dict]) -> int:
+        """Queues rows for the next flush and returns how many were inserted."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((rows, future))
+        self._pending_rows += len(rows)
+
+        if self._pending_rows >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_queue_time, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending, self._pending_rows = self._pending, [], 0
+        if pending:
+            # Keep a reference so the task isn't garbage collected mid-flight
+            task = asyncio.create_task(self.process_batch(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def process_batch(self, pending: list[tuple[list[dict], asyncio.Future]]):
+        rows = [row for caller_rows, _ in pending for row in caller_rows]
+        failed: set[asyncio.Future] = set()
+        try:
+            async with self.session_factory() as session:
+                service = IngestionService(session)
+                try:
+                    async with session.begin_nested():
+                        await service._insert_observations(rows)
+                except Exception as e:
+                    # Retry callers one by one so a bad row only fails its own request
+                    logger.warning(f"Coalesced insert of {len(rows)} rows failed, isolating callers: {e}")
+                    for caller_rows, future in pending:
+                        try:
+                            async with session.begin_nested():
+                                await service._insert_observations(caller_rows)
+                        except Exception as err:
+                            logger.error(f"Batch insert of {len(caller_rows)} rows failed: {err}")
+                            failed.add(future)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Coalesced batch commit of {len(rows)} rows failed: {e}")
+            failed = {future for _, future in pending}
+
+        for caller_rows, future in pending:
+            if future.done():
+                continue
+            if future in failed:
+                future.set_exception(HTTPException(status_code=500, detail="Batch insert failed"))
+            else:
+                future.set_result(len(caller_rows))
+
+
+observation_batcher = ObservationBatcher(max_batch_size=5000, max_queue_time=0.010)
@@ -1,4 +1,5 @@
 import os
+import functools
 import firebase_admin
 from firebase_admin import credentials, storage
 from datetime import timedelta
@@ -21,11 +22,20 @@ try:
 except Exception as e:
     print(f"Warning: Firebase initialization failed. Check credentials. {e}")
 
+# Read once; the bucket is fixed for the lifetime of the process
+_BUCKET_NAME = os.getenv('FIREBASE_STORAGE_BUCKET')
+# Recorded on MediaFile rows; 'unknown' when Firebase isn't configured
+BUCKET_NAME = _BUCKET_NAME or 'unknown'
+
+@functools.lru_cache(maxsize=1)
+def _get_bucket(bucket_name: str):
+    # Reuses the default app's credentials instead of re-resolving them per request
+    return storage.bucket(bucket_name)
+
 class MediaService:
     @staticmethod
     def generate_signed_url(user_id: str, filename: str, content_type: str):
-        bucket_name = os.getenv('FIREBASE_STORAGE_BUCKET')
-        if not bucket_name:
+        if not _BUCKET_NAME:
              # Fallback for local testing without firebase configured
              return {
                  "upload_url": "http://localhost:fake-s3/upload",
@@ -34,7 +44,7 @@ class MediaService:
              }
 
         try:
-            bucket = storage.bucket()
+            bucket = _get_bucket(_BUCKET_NAME)
             # Organize files by user
             blob_path = f"users/{user_id}/uploads/{filename}"
             blob = bucket.blob(blob_path)
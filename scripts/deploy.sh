@@ -1,7 +1,8 @@
 #!/bin/bash
 
 # A helper script to deploy this app to Google Cloud Run
-# Usage: ./scripts/deploy.sh [PROJECT_ID] [REGION]
+# Usage: ALLOWED_ORIGINS=https://app.example.com ./scripts/deploy.sh [PROJECT_ID] [REGION]
+#   ALLOWED_ORIGINS is the comma-separated list of browser origins allowed by CORS.
 
 PROJECT_ID=$1
 REGION=${2:-us-central1}
@@ -13,10 +14,17 @@ if [ -z "$PROJECT_ID" ]; then
     exit 1
 fi
 
+if [ -z "$ALLOWED_ORIGINS" ]; then
+    echo "ALLOWED_ORIGINS is not set. Browsers on other origins would be rejected by CORS."
+    echo "Example: ALLOWED_ORIGINS=https://app.example.com ./scripts/deploy.sh $PROJECT_ID"
+    exit 1
+fi
+
 echo "========================================================"
 echo " Deploying to Google Cloud Run"
 echo " Project: $PROJECT_ID"
 echo " Region:  $REGION"
+echo " Origins: $ALLOWED_ORIGINS"
 echo "========================================================"
 
 # 1. Build the container image using Cloud Build
@@ -41,7 +49,8 @@ gcloud run deploy $SERVICE_NAME \
     --project $PROJECT_ID \
     --allow-unauthenticated \
     --set-env-vars FIREBASE_STORAGE_BUCKET="${PROJECT_ID}.appspot.com" \
-    --set-env-vars LOG_LEVEL="info"
+    --set-env-vars LOG_LEVEL="info" \
+    --set-env-vars "^@^ALLOWED_ORIGINS=${ALLOWED_ORIGINS}"
 
 # NOTE: Database connection isn't set here because it involves sensitive passwords.
 # You must go to the Cloud Console and set the DATABASE_URL environment variable manually
@@ -34,6 +34,8 @@ CREATE TABLE IF NOT EXISTS data_sources (
     is_trusted BOOLEAN DEFAULT FALSE
 );
 
+CREATE UNIQUE INDEX IF NOT EXISTS ix_data_sources_name ON data_sources (name);
+
 -- 4. OBSERVATION ENGINE
 CREATE TABLE IF NOT EXISTS metric_definitions (
     id SERIAL PRIMARY KEY,
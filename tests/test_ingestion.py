@@ -0,0 +1,189 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from sqlalchemy import ARRAY, event, func, select
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+
+from app.models import DataSource, HealthObservation, MetricCategory, MetricDefinition
+from app.services import ingestion
+from app.services.ingestion import IngestionService, ObservationBatcher
+
+# The models target Postgres; these let the ingest tables be created on SQLite.
+@compiles(UUID, "sqlite")
+def _compile_uuid(type_, compiler, **kw):
+    return "CHAR(32)"
+
+@compiles(ARRAY, "sqlite")
+def _compile_array(type_, compiler, **kw):
+    return "TEXT"
+
+
+def _rows(count: int, bad_row: bool = False) -> list[dict]:
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "user_id": uuid.uuid4(),
+            "metric_id": 1,
+            "source_id": None,
+            "recorded_at": now,
+            "ingested_at": now,
+            "value_numeric": float(i),
+            "value_text": None,
+            "raw_metadata": None,
+        }
+        for i in range(count)
+    ]
+    if bad_row:
+        # Violates check_has_value
+        rows[-1]["value_numeric"] = None
+    return rows
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'ingest.db'}")
+
+    # pysqlite's implicit transactions break SAVEPOINT; let SQLAlchemy emit BEGIN itself
+    @event.listens_for(engine.sync_engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    async def _create():
+        async with engine.begin() as conn:
+            for model in (DataSource, MetricDefinition, HealthObservation):
+                await conn.run_sync(model.__table__.create)
+            await conn.execute(MetricDefinition.__table__.insert().values(
+                id=1, code="HK_HR_RESTING", display_name="Resting HR", category=MetricCategory.Vitals
+            ))
+
+    asyncio.run(_create())
+    yield async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
+async def _count(session_factory) -> int:
+    async with session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(HealthObservation))).scalar_one()
+
+
+def test_concurrent_callers_share_one_flush(session_factory):
+    async def run():
+        batcher = ObservationBatcher(max_batch_size=5000, max_queue_time=0.05, session_factory=session_factory)
+        results = await asyncio.gather(*(batcher.process(_rows(10)) for _ in range(3)))
+        return results, await _count(session_factory)
+
+    results, stored = asyncio.run(run())
+    assert results == [10, 10, 10]
+    assert stored == 30
+
+
+def test_flushes_when_max_batch_size_is_reached(session_factory):
+    async def run():
+        # A queue time this long would stall the test if the size trigger didn't fire
+        batcher = ObservationBatcher(max_batch_size=20, max_queue_time=60, session_factory=session_factory)
+        return await asyncio.wait_for(
+            asyncio.gather(batcher.process(_rows(10)), batcher.process(_rows(10))), timeout=5
+        )
+
+    assert asyncio.run(run()) == [10, 10]
+
+
+def test_bad_rows_only_fail_their_own_caller(session_factory):
+    async def run():
+        batcher = ObservationBatcher(max_batch_size=5000, max_queue_time=0.05, session_factory=session_factory)
+        results = await asyncio.gather(
+            batcher.process(_rows(10)),
+            batcher.process(_rows(10, bad_row=True)),
+            batcher.process(_rows(5)),
+            return_exceptions=True,
+        )
+        return results, await _count(session_factory)
+
+    (good, bad, other), stored = asyncio.run(run())
+    assert good == 10
+    assert other == 5
+    assert isinstance(bad, HTTPException) and bad.status_code == 500
+    assert stored == 15
+
+
+@pytest.fixture
+def fresh_caches():
+    ingestion._SOURCE_IDS.clear()
+    ingestion._METRIC_MAP_EXPIRES = 0.0
+    yield
+    ingestion._SOURCE_IDS.clear()
+    ingestion._METRIC_MAP_EXPIRES = 0.0
+
+
+async def _body_chunks(items: list, chunk_bytes: int = 4096, delay: float = 0):
+    body = orjson.dumps({"data": items})
+    for i in range(0, len(body), chunk_bytes):
+        if delay:
+            await asyncio.sleep(delay)
+        yield body[i:i + chunk_bytes]
+
+
+def _stream_items(count: int) -> list[dict]:
+    now = datetime.now(timezone.utc).isoformat()
+    return [{"metric_code": "HK_HR_RESTING", "recorded_at": now, "value_numeric": 60.0} for _ in range(count)]
+
+
+def test_failed_stream_only_caches_a_committed_source(session_factory, fresh_caches):
+    items = _stream_items(2500)
+    # Fails validation in the third chunk, after two chunks were inserted
+    del items[2200]["recorded_at"]
+
+    async def run():
+        async with session_factory() as session:
+            with pytest.raises(RequestValidationError):
+                await IngestionService(session).process_stream(uuid.uuid4(), "NEW", _body_chunks(items))
+        async with session_factory() as session:
+            source_ids = (await session.execute(select(DataSource.id).where(DataSource.name == "NEW"))).scalars().all()
+        return source_ids, await _count(session_factory)
+
+    source_ids, stored = asyncio.run(run())
+    assert source_ids == [ingestion._SOURCE_IDS["NEW"]]
+    assert stored == 0
+
+
+def test_stalled_stream_times_out(session_factory, fresh_caches, monkeypatch):
+    monkeypatch.setattr(ingestion, "STREAM_READ_TIMEOUT_SECONDS", 0.05)
+
+    async def run():
+        async with session_factory() as session:
+            with pytest.raises(HTTPException) as exc_info:
+                await IngestionService(session).process_stream(
+                    uuid.uuid4(), "Slow", _body_chunks(_stream_items(10), chunk_bytes=64, delay=0.2)
+                )
+        return exc_info.value
+
+    assert asyncio.run(run()).status_code == 408
+
+
+@pytest.mark.parametrize("body", [b"[]", b'{"rows": []}', b'{"data": {"item": {}}}', b'{"data": 5}'])
+def test_stream_without_data_array_is_rejected(session_factory, fresh_caches, body):
+    async def chunks():
+        yield body
+
+    async def run():
+        async with session_factory() as session:
+            with pytest.raises(RequestValidationError) as exc_info:
+                await IngestionService(session).process_stream(uuid.uuid4(), "NEW", chunks())
+        async with session_factory() as session:
+            sources = (await session.execute(select(func.count()).select_from(DataSource))).scalar_one()
+        return exc_info.value.errors()[0]["loc"], sources
+
+    loc, sources = asyncio.run(run())
+    assert loc == ("body", "data")
+    assert sources == 0
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.exceptions import RequestValidationError
+from sqlalchemy import Text, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.database import Base
+from app.models import HealthObservation, MetricCategory, MetricDefinition, User
+from app.services import ingestion
+from app.services.ingestion import IngestionService
+
+from tests.test_ingestion import _body_chunks, _stream_items
+
+# COPY only runs on Postgres. Point this at a disposable database: its tables are dropped.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+USER_ID = uuid.UUID("d290f1ee-6c54-4b01-90e6-d701748f0851")
+
+
+@pytest.fixture
+def session_factory():
+    # Each test step runs in its own event loop, so connections can't be pooled across them
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)
+
+    async def _create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(User.__table__.insert().values(id=USER_ID, email="test@healx.ai"))
+            await conn.execute(MetricDefinition.__table__.insert().values(
+                id=1, code="HK_HR_RESTING", display_name="Resting HR", category=MetricCategory.Vitals
+            ))
+
+    asyncio.run(_create())
+    ingestion._SOURCE_IDS.clear()
+    ingestion._METRIC_MAP_EXPIRES = 0.0
+    yield async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    ingestion._SOURCE_IDS.clear()
+    ingestion._METRIC_MAP_EXPIRES = 0.0
+    asyncio.run(engine.dispose())
+
+
+def test_failed_stream_rolls_back_copied_chunks(session_factory):
+    items = _stream_items(2500)
+    # Fails validation in the third chunk, after two chunks went through COPY
+    del items[2200]["recorded_at"]
+
+    async def run():
+        # With the metric map already cached, no SQLAlchemy statement precedes the first COPY
+        async with session_factory() as session:
+            await IngestionService(session)._load_metric_map()
+        async with session_factory() as session:
+            with pytest.raises(RequestValidationError):
+                await IngestionService(session).process_stream(USER_ID, "NEW", _body_chunks(items))
+        async with session_factory() as session:
+            return (await session.execute(select(func.count()).select_from(HealthObservation))).scalar_one()
+
+    assert asyncio.run(run()) == 0
+
+
+def test_stream_commits_copied_chunks(session_factory):
+    async def run():
+        async with session_factory() as session:
+            result = await IngestionService(session).process_stream(USER_ID, "NEW", _body_chunks(_stream_items(2500)))
+        async with session_factory() as session:
+            stored = (await session.execute(select(func.count()).select_from(HealthObservation))).scalar_one()
+        return result, stored
+
+    result, stored = asyncio.run(run())
+    assert result["processed"] == 2500
+    assert stored == 2500
+
+
+def test_insert_paths_store_numeric_values_identically(session_factory):
+    # float8 -> numeric keeps 15 significant digits, so this stores as 1234567890.123460
+    value = 1234567890.1234567
+    now = datetime.now(timezone.utc)
+    row = {
+        "user_id": USER_ID, "metric_id": 1, "source_id": None, "recorded_at": now, "ingested_at": now,
+        "value_numeric": value, "value_text": None, "raw_metadata": None,
+    }
+
+    async def run():
+        async with session_factory() as session:
+            service = IngestionService(session)
+            await service._insert_observations([row])  # executemany
+            await service._insert_observations([row] * ingestion.COPY_THRESHOLD)  # COPY
+            await session.commit()
+        async with session_factory() as session:
+            stored = await session.execute(select(func.cast(HealthObservation.value_numeric, Text)).distinct())
+            return stored.scalars().all()
+
+    assert asyncio.run(run()) == ["1234567890.123460"]